@@ -3,3 +3,5 @@
 
 from .si_stack import parseheader
 from .si_stack import XYT
+from .si_readplan import ReadPlan
+from .si_pipeline import pipelined_read
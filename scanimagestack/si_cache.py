@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+This module holds an on-disk cache of registered image frames. Per image plane and channel, the registered frames are stored in a memory mapped array that is filled lazily as frames are requested. The cache is keyed by a fingerprint of the raw tiff files and of the registration (function and shift parameters); it is emptied as soon as either changes.
+
+Created on Mon Oct 19, 2026
+
+@author: pgoltstein
+"""
+
+#<><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
+# Imports
+
+import os
+import hashlib
+import threading
+import numpy as np
+
+# ops entries that determine the outcome of suite2p registration (shift_imagedata)
+REGISTRATION_KEYS = ["bidiphase", "xoff", "yoff", "nonrigid", "nblocks", "xblock", "yblock", "xoff1", "yoff1"]
+
+
+#<><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
+# Functions
+
+def _update_hash( sha, param ):
+    """ Feeds a (nested) registration parameter into a hashlib object """
+    if isinstance(param, dict):
+        keys = [k for k in REGISTRATION_KEYS if k in param]
+        if len(keys) == 0:
+            keys = sorted(param.keys(), key=str)
+        for k in keys:
+            sha.update( str(k).encode() )
+            _update_hash( sha, param[k] )
+    elif isinstance(param, np.ndarray) and param.ndim == 0:
+        _update_hash( sha, param[()] )
+    elif isinstance(param, np.ndarray) and param.dtype != object:
+        sha.update( str((param.dtype.str, param.shape)).encode() )
+        sha.update( np.ascontiguousarray(param).tobytes() )
+    elif isinstance(param, (list, tuple, np.ndarray)):
+        sha.update( "seq{}".format(len(param)).encode() )
+        for p in param:
+            _update_hash( sha, p )
+    else:
+        sha.update( repr(param).encode() )
+
+
+def file_fingerprint( block_files ):
+    """ Returns a fingerprint of the set of (tiff) files, based on their names, sizes and modification times
+        Inputs
+        - block_files: List with full paths to the files
+        Returns
+        - fingerprint: hex string
+    """
+    sha = hashlib.sha1()
+    for filename in block_files:
+        stat = os.stat(filename)
+        sha.update( "{}:{}:{}".format( os.path.basename(filename), stat.st_size, stat.st_mtime_ns ).encode() )
+    return sha.hexdigest()
+
+
+def registration_fingerprint( imregfunc, imregparams, plane_no ):
+    """ Returns a fingerprint of the registration of a single plane. Parameters that are a list/array of (suite2p ops) dictionaries are reduced to the dictionary of the plane, and of those only the entries in REGISTRATION_KEYS are used.
+        Inputs
+        - imregfunc: The image registration function
+        - imregparams: List of parameters supplied to the image registration function
+        - plane_no: The image plane
+        Returns
+        - fingerprint: hex string
+    """
+    sha = hashlib.sha1()
+    sha.update( "{}.{}".format( getattr(imregfunc, "__module__", ""), getattr(imregfunc, "__qualname__", repr(imregfunc)) ).encode() )
+    for param in imregparams:
+        if isinstance(param, (list, tuple, np.ndarray)) and np.ndim(param) == 1 and len(param) > plane_no and all( isinstance(p, dict) for p in param ):
+            param = param[plane_no]
+        _update_hash( sha, param )
+    return sha.hexdigest()
+
+
+#<><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
+# Classes
+
+class RegCachePlane(object):
+    """ The cached registered frames of a single plane and channel, stored as [frames x y x x] in a memory mapped .npy file, with a boolean .npy file that marks which frames are present.
+    """
+
+    def __init__(self, cachedir, fingerprint, nframes, resolution):
+        """ Opens the cache, empties it if its fingerprint does not match
+            Inputs
+            - cachedir: Directory holding the cache files of this plane and channel
+            - fingerprint: Fingerprint of raw files and registration
+            - nframes: Number of frames in the stack
+            - resolution: (y,x) frame size
+        """
+        super(RegCachePlane, self).__init__()
+        self._cachedir = cachedir
+        self._fingerprint = fingerprint
+        self._nframes = int(nframes)
+        self._resolution = tuple(resolution)
+        self._framefile = os.path.join(cachedir, "frames.npy")
+        self._filledfile = os.path.join(cachedir, "filled.npy")
+        self._fingerprintfile = os.path.join(cachedir, "fingerprint.txt")
+        self._frames = None
+        self._filled = None
+        self._lock = threading.Lock()
+
+        os.makedirs(cachedir, exist_ok=True)
+        stored_fingerprint = None
+        if os.path.isfile(self._fingerprintfile):
+            with open(self._fingerprintfile) as f:
+                stored_fingerprint = f.read().strip()
+
+        # Evict if fingerprint changed, otherwise reopen the existing files
+        if stored_fingerprint != fingerprint or not os.path.isfile(self._filledfile):
+            self.clear()
+        else:
+            self._filled = np.lib.format.open_memmap(self._filledfile, mode="r+")
+            if os.path.isfile(self._framefile):
+                self._frames = np.lib.format.open_memmap(self._framefile, mode="r+")
+            if self._filled.shape != (self._nframes,) or (self._frames is not None and self._frames.shape != (self._nframes,)+self._resolution):
+                self.clear()
+
+    @property
+    def fingerprint(self):
+        """ Fingerprint of raw files and registration """
+        return self._fingerprint
+
+    @property
+    def filled(self):
+        """ Boolean array, True for frames that are present in the cache """
+        return self._filled
+
+    def clear(self):
+        """ Removes all cached frames and stores the current fingerprint """
+        self._frames = None
+        self._filled = None
+        for filename in [self._framefile, self._filledfile]:
+            if os.path.isfile(filename):
+                os.remove(filename)
+        with open(self._fingerprintfile, "w") as f:
+            f.write(self._fingerprint)
+        self._filled = np.lib.format.open_memmap(self._filledfile, mode="w+", dtype=bool, shape=(self._nframes,))
+
+    def store(self, frames, imagedata):
+        """ Stores registered frames in the cache
+            Inputs
+            - frames: np.ndarray with frame numbers
+            - imagedata: Registered image data [y x x x len(frames)]
+        """
+        with self._lock:
+            if self._frames is None:
+                self._frames = np.lib.format.open_memmap(self._framefile, mode="w+", dtype=imagedata.dtype, shape=(self._nframes,)+self._resolution)
+        self._frames[frames,:,:] = imagedata.transpose(2,0,1)
+        self._frames.flush()
+        self._filled[frames] = True
+        self._filled.flush()
+
+    def load(self, frames):
+        """ Returns registered frames from the cache as [y x x x len(frames)] """
+        return np.ascontiguousarray( self._frames[frames,:,:].transpose(1,2,0) )
+
+
+class RegCache(object):
+    """ On-disk cache of registered frames for all planes and channels of an image stack. Frames are cached per plane and channel in a subfolder of cachepath.
+    """
+
+    def __init__(self, cachepath, block_files, nframes, resolution):
+        """ Initializes the cache
+            Inputs
+            - cachepath: Directory in which the cache is stored
+            - block_files: List with full paths to the raw (tiff) files
+            - nframes: Number of frames in the stack
+            - resolution: (y,x) frame size
+        """
+        super(RegCache, self).__init__()
+        self._cachepath = cachepath
+        self._file_fingerprint = file_fingerprint(block_files)
+        self._nframes = nframes
+        self._resolution = resolution
+        self._planes = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cachepath(self):
+        """ Directory in which the cache is stored """
+        return self._cachepath
+
+    def plane(self, plane_no, channel, reg_fingerprint):
+        """ Returns the RegCachePlane for plane and channel, (re)opened if the registration fingerprint has changed """
+        fingerprint = self._file_fingerprint + "-" + reg_fingerprint
+        with self._lock:
+            cacheplane = self._planes.get((plane_no,channel), None)
+            if cacheplane is None or cacheplane.fingerprint != fingerprint:
+                cachedir = os.path.join( self._cachepath, "plane{}_ch{}".format(plane_no,channel) )
+                cacheplane = RegCachePlane( cachedir, fingerprint, self._nframes, self._resolution )
+                self._planes[(plane_no,channel)] = cacheplane
+            return cacheplane
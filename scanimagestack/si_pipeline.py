@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+This module holds a pipelined reader for image stacks. Frames are processed in chunks by a reader stage (disk), a registration stage (imregfunc, e.g. bidiphase, rigid and nonrigid correction via shift_imagedata) and an output stage, connected by bounded queues. Reading and registration thereby overlap, and memory use is bounded by the number of chunks in flight.
+
+Created on Mon Oct 19, 2026
+
+@author: pgoltstein
+"""
+
+#<><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
+# Imports
+
+import copy
+import queue
+import threading
+import numpy as np
+from tqdm import tqdm
+
+
+#<><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
+# Functions
+
+def _put( q, item, stop ):
+    """ Puts item on queue q, gives up when stop is set """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get( q, stop ):
+    """ Gets an item from queue q, returns None when stop is set """
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return None
+
+
+def pipelined_read( imagestack, indices=slice(None), out=None, consumer=None, chunksize=100, nreaders=1, nregistrars=1, queuesize=2 ):
+    """ Reads (and registers) frames of the current plane and channel of an image stack with overlapping reader and registration stages.
+        Inputs
+        - imagestack: scanimagestack.XYT object, registration is applied if imagestack.register is True
+        - indices: NumPy-style frame indices (default: all frames)
+        - out: Preallocated output array [y x x x number of requested frames] (optional)
+        - consumer: Function called as consumer(start, imagedata) for each chunk, in order; start is the position of the chunk in the requested frames (optional)
+        - chunksize: Number of frames per chunk
+        - nreaders: Number of reader workers
+        - nregistrars: Number of registration workers
+        - queuesize: Maximum number of chunks waiting between two stages
+        Returns
+        - out: The output array, or None if only a consumer was supplied
+        Raises ValueError if nreaders, nregistrars, chunksize or queuesize is smaller than 1
+    """
+    if nreaders < 1 or nregistrars < 1:
+        raise ValueError("The pipeline needs at least one reader and one registration worker, got nreaders={} and nregistrars={}".format(nreaders, nregistrars))
+    if chunksize < 1 or queuesize < 1:
+        raise ValueError("The pipeline needs chunks of at least one frame and bounded queues of at least one chunk, got chunksize={} and queuesize={}".format(chunksize, queuesize))
+
+    # Work on a copy, so that the pipeline is not affected by changing plane or channel
+    stack = copy.copy(imagestack)
+    verbose = stack.verbose
+    stack.verbose = False
+    frames = stack._readplan(indices).frames
+    nframes = len(frames)
+    chunk_starts = list(range(0, nframes, chunksize))
+    nchunks = len(chunk_starts)
+    regcache = stack._get_regcache() if (stack.register and stack._regcache is not None) else None
+
+    # Queues between the stages, the semaphore bounds the number of chunks in flight
+    chunk_queue = queue.Queue()
+    for c,start in enumerate(chunk_starts):
+        chunk_queue.put( (c, start, frames[start:start+chunksize]) )
+    read_queue = queue.Queue(maxsize=queuesize)
+    output_queue = queue.Queue(maxsize=queuesize)
+    in_flight = threading.BoundedSemaphore( nreaders + nregistrars + (2*queuesize) )
+    stop = threading.Event()
+    readers_done = []
+
+    def reader():
+        """ Reader stage: loads the unique frames of a chunk, cached frames from the registration cache and all others from disk """
+        while not stop.is_set():
+            if not in_flight.acquire(timeout=0.1):
+                continue
+            try:
+                c, start, chunk_frames = chunk_queue.get_nowait()
+            except queue.Empty:
+                in_flight.release()
+                readers_done.append(True)
+                return
+            try:
+                plan = stack._readplan(chunk_frames)
+                if regcache is not None:
+                    cached = np.array( regcache.filled[plan.unique_frames], dtype=bool )
+                else:
+                    cached = np.zeros( plan.nunique, dtype=bool )
+                if cached.any():
+                    cacheddata = regcache.load(plan.unique_frames[cached])
+                    imagedata = stack._read_frames(plan.unique_frames[~cached])
+                else:
+                    cacheddata = None
+                    imagedata = stack._read_plan(plan)
+                item = (c, start, plan, cached, cacheddata, imagedata, None)
+            except Exception as e:
+                item = (c, start, None, None, None, None, e)
+            if not _put( read_queue, item, stop ):
+                return
+
+    def registrar():
+        """ Registration stage: registers the uncached frames of a chunk, merges them with the cached frames and puts them back in requested order """
+        while not stop.is_set():
+            item = _get( read_queue, stop )
+            if item is None:
+                return
+            c, start, plan, cached, cacheddata, imagedata, error = item
+            if error is None:
+                try:
+                    missing_frames = plan.unique_frames[~cached]
+                    if stack.register and len(missing_frames) > 0:
+                        imagedata = stack.imregfunc(imagedata, stack.plane, missing_frames, *stack.imregparams)
+                        if regcache is not None:
+                            regcache.store(missing_frames, imagedata)
+                    if cacheddata is not None:
+                        merged = np.zeros( stack.resolution + (plan.nunique,), dtype=np.result_type(cacheddata, imagedata) )
+                        merged[:,:,cached] = cacheddata
+                        merged[:,:,~cached] = imagedata
+                        imagedata = merged
+                    imagedata = plan.scatter(imagedata)
+                except Exception as e:
+                    imagedata, error = None, e
+            if not _put( output_queue, (c, start, imagedata, error), stop ):
+                return
+
+    readers = [ threading.Thread(target=reader, daemon=True) for _ in range(nreaders) ]
+    registrars = [ threading.Thread(target=registrar, daemon=True) for _ in range(nregistrars) ]
+    workers = readers + registrars
+    for worker in workers:
+        worker.start()
+
+    # Output stage: fill the output array and/or feed the consumer in order of the requested frames
+    bar = tqdm(total=nframes, desc="Reading", unit="Fr") if verbose else None
+    try:
+        waiting = {}
+        next_chunk = 0
+        while next_chunk < nchunks:
+            try:
+                c, start, imagedata, error = output_queue.get(timeout=0.1)
+            except queue.Empty:
+                # Registration workers only stop at the end, reader workers when all chunks are taken; any other stop loses a chunk
+                registrars_died = not all( worker.is_alive() for worker in registrars )
+                readers_died = sum( not worker.is_alive() for worker in readers ) > len(readers_done)
+                if (registrars_died or readers_died) and output_queue.empty():
+                    raise RuntimeError("Pipeline workers stopped before all chunks were delivered ({} of {} chunks)".format(next_chunk, nchunks))
+                continue
+            if error is not None:
+                raise error
+            waiting[c] = (start, imagedata)
+            while next_chunk in waiting:
+                start, imagedata = waiting.pop(next_chunk)
+                if out is None and consumer is None:
+                    out = np.zeros( stack.resolution + (nframes,), dtype=imagedata.dtype )
+                if out is not None:
+                    out[:,:,start:start+imagedata.shape[2]] = imagedata
+                if consumer is not None:
+                    consumer(start, imagedata)
+                if bar is not None:
+                    bar.update(imagedata.shape[2])
+                next_chunk += 1
+                in_flight.release()
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+        if bar is not None:
+            bar.close()
+
+    if out is None and consumer is None:
+        out = np.zeros( stack.resolution + (0,), dtype=stack._datatype )
+    return out
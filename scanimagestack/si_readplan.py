@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+This module holds the read planner that translates NumPy-style frame indices (int, slice, list, ndarray, boolean mask, negative indices) into a sorted and deduplicated per-block reading plan, and scatters the loaded data back into the requested order. It is independent of the file format, so it can be shared by all stack readers.
+
+Created on Mon Oct 19, 2026
+
+@author: pgoltstein
+"""
+
+#<><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
+# Imports
+
+import numpy as np
+
+
+#<><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
+# Functions
+
+def normalize_indices(indices, nframes):
+    """ Converts NumPy-style indices into an array of (non-negative) frame numbers in the requested order
+        Inputs
+        - indices: int, slice, list/tuple/np.ndarray of ints, or boolean mask of length nframes
+        - nframes: Number of frames in the stack
+        Returns
+        - frames: np.ndarray (int64) with frame numbers
+        Raises IndexError for out-of-range indices, boolean masks of the wrong length and unsupported index types
+    """
+
+    # Slices follow NumPy semantics (clipped to the stack)
+    if isinstance(indices, slice):
+        return np.arange(nframes, dtype=np.int64)[indices]
+
+    # Single frame
+    if isinstance(indices, (int, np.integer)) and not isinstance(indices, (bool, np.bool_)):
+        frames = np.array([indices,], dtype=np.int64)
+
+    # Sequence of frames or boolean mask
+    elif isinstance(indices, (list, tuple, np.ndarray)):
+        indices = np.asarray(indices)
+        if indices.ndim != 1:
+            raise IndexError("Frame indices should be one dimensional, got an array with shape {}".format(indices.shape))
+        if indices.dtype == bool:
+            if len(indices) != nframes:
+                raise IndexError("Boolean mask has length {}, but stack has {} frames".format(len(indices), nframes))
+            return np.flatnonzero(indices).astype(np.int64)
+        if len(indices) == 0:
+            return np.zeros((0,), dtype=np.int64)
+        if not np.issubdtype(indices.dtype, np.integer):
+            raise IndexError("Frame indices should be integers or booleans, got dtype {}".format(indices.dtype))
+        frames = indices.astype(np.int64)
+
+    else:
+        raise IndexError("Only integers, slices, integer or boolean arrays are valid frame indices, got {}".format(type(indices).__name__))
+
+    # Wrap negative indices and check range
+    out_of_range = (frames < -nframes) | (frames >= nframes)
+    if out_of_range.any():
+        raise IndexError("Requested frame {}, but stack has only {} frames".format(frames[out_of_range][0], nframes))
+    frames[frames < 0] += nframes
+    return frames
+
+
+#<><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
+# Classes
+
+class ReadPlan(object):
+    """ This class holds the plan for reading a set of frames from a stack that is stored in blocks (files) of equal size.
+
+        Frames are deduplicated and sorted, and then split per block using a sort (np.unique) and searchsorted, so that planning costs O(n log n) regardless of the number of blocks. Frame f of the stack is stored at position start_frame + f*frame_jump of the concatenated blocks.
+         * plan.unique_frames holds the sorted frames that have to be loaded
+         * plan.blocks() yields, per block, the frame positions within the block and the corresponding positions in unique_frames
+         * plan.scatter(data) puts data loaded for unique_frames (along the last axis) back into the requested order
+    """
+
+    def __init__(self, indices, nframes, nframesperblock, start_frame=0, frame_jump=1):
+        """ Makes the reading plan
+            Inputs
+            - indices: NumPy-style frame indices (see normalize_indices)
+            - nframes: Number of frames in the stack
+            - nframesperblock: Number of stored images per block file
+            - start_frame: Position of frame 0 in the concatenated blocks
+            - frame_jump: Number of stored images between consecutive frames
+        """
+        super(ReadPlan, self).__init__()
+        self._frames = normalize_indices(indices, nframes)
+
+        # Deduplicate and sort; inverse maps requested order onto unique frames
+        self._unique_frames, self._inverse = np.unique(self._frames, return_inverse=True)
+        self._inverse = self._inverse.reshape(-1)
+        self._identity = len(self._unique_frames) == len(self._frames) and np.array_equal(self._frames, self._unique_frames)
+
+        # Positions of the frames in the blocks; block numbers are sorted because unique_frames is, so each block is a contiguous range
+        image_ixs = start_frame + (self._unique_frames * frame_jump)
+        self._block_per_frame = image_ixs // nframesperblock
+        self._ixs_in_block = image_ixs - (self._block_per_frame * nframesperblock)
+        self._block_numbers = np.unique(self._block_per_frame)
+        self._block_starts = np.searchsorted(self._block_per_frame, self._block_numbers, side="left")
+        self._block_stops = np.searchsorted(self._block_per_frame, self._block_numbers, side="right")
+
+    @property
+    def frames(self):
+        """ Requested frames, in requested order """
+        return self._frames
+
+    @property
+    def unique_frames(self):
+        """ Sorted, deduplicated frames that have to be loaded """
+        return self._unique_frames
+
+    @property
+    def inverse(self):
+        """ Positions in unique_frames of the requested frames """
+        return self._inverse
+
+    @property
+    def nframes(self):
+        """ Number of requested frames """
+        return len(self._frames)
+
+    @property
+    def nunique(self):
+        """ Number of frames that have to be loaded """
+        return len(self._unique_frames)
+
+    @property
+    def block_numbers(self):
+        """ Block files that have to be opened """
+        return self._block_numbers
+
+    def blocks(self):
+        """ Yields per block: block number, frame positions within the block, positions in unique_frames """
+        for bnr,start,stop in zip(self._block_numbers, self._block_starts, self._block_stops):
+            yield int(bnr), self._ixs_in_block[start:stop], np.arange(start,stop)
+
+    def scatter(self, data):
+        """ Returns data (loaded for unique_frames, along the last axis) in the requested order """
+        if self._identity:
+            return data
+        return data[..., self._inverse]
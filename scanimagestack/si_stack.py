@@ -21,6 +21,9 @@ import numpy as np
 from ScanImageTiffReader import ScanImageTiffReader
 from tqdm import tqdm
 import argparse
+from .si_cache import RegCache, registration_fingerprint
+from .si_readplan import ReadPlan
+from .si_pipeline import pipelined_read
 
 
 #<><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
@@ -110,13 +113,16 @@ class XYT(object):
          * data = imagestack[1] returns the second frame (zero based slice)
          * data = imagestack[[5,8,10]] returns frames 5,8 and 10
          * data = imagestack[::2] returns every second frame.
+         * data = imagestack[-1] returns the last frame
+         * data = imagestack[mask] returns the frames where the boolean mask (length nframes) is True
+         Frame indices outside the stack raise an IndexError.
 
          In addition, the class provides access to the meta data as properties. For instance:
          * res = XYT.resolution returns the [y,x] image resolution
          * nchannels = XYT.nchannels returns number of image channels
     """
 
-    def __init__(self, filestem='', filepath='.', extention="tif", imagesettingsfile=None, do_reg = False, imregfunc=None, imregparams=[], verbose=False):
+    def __init__(self, filestem='', filepath='.', extention="tif", imagesettingsfile=None, do_reg = False, imregfunc=None, imregparams=[], regcachepath=None, verbose=False):
         """ Initializes the image stack and gathers the meta data
             Inputs
             - filestem: Part of the file name that is shared among all tiffs belonging to the stack (optional, if left out all tiffs in filepath will be included)
@@ -126,6 +132,7 @@ class XYT(object):
             - do_reg: Whether or not to perform registration on the images
             - imregfunc: Function to use for image registration
             - imregparams: List of parameters to supply to imregfunc
+            - regcachepath: Directory for an on-disk cache of registered frames (None: no caching)
             - verbose: print warnings
         """
         super(XYT, self).__init__()
@@ -175,6 +182,7 @@ class XYT(object):
         if imregfunc is not None:
             self.imregfunc = imregfunc
         self.imregparams = imregparams
+        self.regcachepath = regcachepath
 
         self._datatype = np.int16
         self.channel = 0
@@ -390,76 +398,97 @@ class XYT(object):
             return
         self._imregfunc = imregfunc
 
+    @property
+    def regcachepath(self):
+        """ Returns the directory of the on-disk cache of registered frames (None if not caching) """
+        if self._regcache is None:
+            return None
+        return self._regcache.cachepath
+
+    @regcachepath.setter
+    def regcachepath(self,regcachepath):
+        """ Sets the directory of the on-disk cache of registered frames, the cache is used whenever register is True. Set to None to disable caching.
+            Cached frames are evicted when the tiff files, the image registration function or the shift parameters in imregparams (also when changed in place) are changed.
+        """
+        if regcachepath is None:
+            self._regcache = None
+        else:
+            self._regcache = RegCache( regcachepath, self._block_files, self.nframes, self.resolution )
+
+    def _get_regcache(self):
+        """ Returns the registered-frame cache of the current plane and channel. The registration fingerprint is recomputed on every call, so that in-place changes to the ops shift arrays evict the cache """
+        reg_fingerprint = registration_fingerprint( self._imregfunc, self._imregparams, self._plane )
+        return self._regcache.plane( self._plane, self._channel, reg_fingerprint )
+
+    def read_pipelined(self, indices=slice(None), out=None, consumer=None, chunksize=100, nreaders=1, nregistrars=1, queuesize=2):
+        """ Reads (and registers) frames in chunks, overlapping disk reading and registration using bounded queues between a reader, registration and output stage (see si_pipeline.pipelined_read)
+            Inputs
+            - indices: NumPy-style frame indices (default: all frames)
+            - out: Preallocated output array [y x x x number of requested frames] (optional)
+            - consumer: Function called as consumer(start, imagedata) for each chunk, in order (optional)
+            - chunksize: Number of frames per chunk
+            - nreaders: Number of reader workers
+            - nregistrars: Number of registration workers
+            - queuesize: Maximum number of chunks waiting between two stages
+            Returns
+            - out: The output array, or None if only a consumer was supplied
+        """
+        return pipelined_read( self, indices=indices, out=out, consumer=consumer, chunksize=chunksize, nreaders=nreaders, nregistrars=nregistrars, queuesize=queuesize )
+
     # Internal function to load the imaging data using slicing
     def __getitem__(self, indices):
         """ Loads and returns the image data directly from disk """
 
-        # Use the provided slice object to get the requested frames
-        n_frames_exceeded = False
-        if isinstance(indices, slice):
-            start = 0 if indices.start is None else indices.start
-            stop = self.nframes if indices.stop is None else indices.stop
-            step = 1 if indices.step is None else indices.step
-            if start > self.nframes or stop > self.nframes:
-                n_frames_exceeded = True
-                n_frames_requested = len(range(start,stop,step))
-            frames = np.arange(self.nframes)[indices]
-        elif isinstance(indices, list) or isinstance(indices, tuple):
-            if max(indices) > self.nframes:
-                n_frames_exceeded = True
-                n_frames_requested = len(indices)
-            frames = np.array(indices)
-        else:
-            if indices > self.nframes:
-                n_frames_exceeded = True
-                n_frames_requested = 1
-            frames = np.array([indices,])
-
-        # Check if the requested frames do not exceed the stack
-        if n_frames_exceeded:
-            print("!!! Requested frames {}, but stack has only {} frames, returning {} 'zero' frames !!!".format(indices,self.nframes,n_frames_requested))
-            return np.zeros((self.yres,self.xres,n_frames_requested),dtype=self._datatype)
-            # raise IndexError("Requested frames {}, but stack has only {} frames".format(indices,self.nframes))
-
-        # Define the indices of the requested frames
+        # Plan which (unique) frames to read from which block file, raises IndexError for invalid indices
+        plan = self._readplan(indices)
+        frames = plan.unique_frames
+
+        # Registered frames, read from the on-disk cache and only registered if not yet present
+        if self._do_register and self._regcache is not None:
+            regcache = self._get_regcache()
+            missing_frames = frames[~regcache.filled[frames]]
+            if len(missing_frames) > 0:
+                regdata = self._imregfunc(self._read_frames(missing_frames), self._plane, missing_frames, *self._imregparams)
+                regcache.store(missing_frames, regdata)
+            return plan.scatter( regcache.load(frames) )
+
+        # Read the stack
+        imagedata = self._read_plan(plan)
+
+        # Register the stack and return
+        if self._do_register:
+            imagedata = self._imregfunc(imagedata, self._plane, frames, *self._imregparams)
+
+        # Return the stack in the requested order
+        return plan.scatter(imagedata)
+
+    def _readplan(self, indices):
+        """ Returns the ReadPlan for the frame indices of the current plane and channel """
         # tiffs are stored as [ch0-sl0, ch1-sl0, ch0-sl1, ch2-sl1, ch0-sl2 etc]
         start_frame = (self._plane * self.nchannels) + self._channel
         frame_jump = self.nchannels * self.nplanes
-        frame_ixs = start_frame + (frames * frame_jump)
-        n_frame_ixs = len(frame_ixs)
-        frame_ids = np.arange(n_frame_ixs)
-
-        # Identify the block files to open, and which frames to load
-        block_ixs_per_frame = np.floor(frame_ixs / self._nframesperblock).astype(int)
-        frame_ixs_in_block = np.mod(frame_ixs, self._nframesperblock)
-        block_numbers,block_inverse = np.unique(block_ixs_per_frame, return_inverse=True)
-        block_indexes = list(range(len(block_numbers)))
-
-        # Split the list of frames into a per-block list
-        frame_ixs_per_block = []
-        frame_ids_per_block = []
-        for b in block_indexes:
-            frame_ixs_per_block.append( list(frame_ixs_in_block[block_inverse==b]) )
-            frame_ids_per_block.append( list(frame_ids[block_inverse==b]) )
-
-        # Loop block files, and frame indices to load all requested frames
-        imagedata = np.zeros((self.yres,self.xres,n_frame_ixs),dtype=self._datatype)
+        return ReadPlan( indices, self.nframes, self._nframesperblock, start_frame=start_frame, frame_jump=frame_jump )
+
+    def _read_frames(self, frames):
+        """ Reads the (unregistered) frames of the current plane and channel from disk, returns [y x x x len(frames)] """
+        plan = self._readplan(frames)
+        return plan.scatter( self._read_plan(plan) )
+
+    def _read_plan(self, plan):
+        """ Reads the (unregistered) unique frames of a ReadPlan from disk, returns [y x x x plan.nunique] """
+
+        # Loop block files, and frame indices to load all planned frames
+        imagedata = np.zeros((self.yres,self.xres,plan.nunique),dtype=self._datatype)
         if self._verbose:
-            with tqdm(total=n_frame_ixs, desc="Reading", unit="Fr") as bar:
-                for bnr,bix in zip(block_numbers,block_indexes):
+            with tqdm(total=plan.nunique, desc="Reading", unit="Fr") as bar:
+                for bnr,ixs,ids in plan.blocks():
                     with ScanImageTiffReader(self._block_files[bnr]) as tifffile:
-                        for ix,id_ in zip( frame_ixs_per_block[bix], frame_ids_per_block[bix] ):
+                        for ix,id_ in zip(ixs,ids):
                             imagedata[:,:,id_] = tifffile.data(beg=ix,end=ix+1)
                             bar.update(1)
         else:
-            for bnr,bix in zip(block_numbers,block_indexes):
+            for bnr,ixs,ids in plan.blocks():
                 with ScanImageTiffReader(self._block_files[bnr]) as tifffile:
-                    for ix,id_ in zip( frame_ixs_per_block[bix], frame_ids_per_block[bix] ):
+                    for ix,id_ in zip(ixs,ids):
                         imagedata[:,:,id_] = tifffile.data(beg=ix,end=ix+1)
-
-        # Register the stack and return
-        if self._do_register:
-            imagedata = self._imregfunc(imagedata, self._plane, frames, *self._imregparams)
-
-        # Return the stack
         return imagedata
@@ -12,9 +12,10 @@ Created on Thu Jan 30, 2020
 @author: pgoltstein
 """
 
-import sys
-sys.path.append('../suite2psupport')
-import si_stack
+import sys, os
+import numpy as np
+sys.path.insert(0,'..')
+from scanimagestack import si_stack
 import suite2psupport
 
 import argparse
@@ -40,6 +41,10 @@ a=Im[:250:5]
 print("dtype {}".format(a.dtype))
 print("Shape of stack: {}".format(a.shape))
 
+print("\nReading frames [-1, 5, 5, 0] (last frame, duplicates, unsorted):")
+a=Im[[-1,5,5,0]]
+print("Shape of stack: {}".format(a.shape))
+print("Duplicates identical: {}".format(np.array_equal(a[:,:,1],a[:,:,2])))
 print("\nTesting properties:")
 print("- xres: {}".format(Im.xres))
 print("- yres: {}".format(Im.yres))
@@ -62,13 +67,15 @@ Im.imregparams = suite2psupport.load_suite2p_ops( Im.filepath )
 Im.imregfunc = suite2psupport.shift_imagedata
 Im.register = True
 
-print("\nReading image 1000000 with registration:")
-b=Im[1000000]
-print("data type of image data: {}".format(b.dtype))
-print("Shape of the stack: {}".format(b.shape))
+print("\nReading image 1000000 with registration (out of range, should raise IndexError):")
+try:
+    b=Im[1000000]
+    print("!!! No IndexError raised, shape of the stack: {}".format(b.shape))
+except IndexError as e:
+    print("IndexError raised as expected: {}".format(e))
 
-print("\nReading image 1000000 to 1000010 with registration:")
-b=Im[1000000:1000010]
+print("\nReading the last 10 frames with registration:")
+b=Im[-10:]
 print("data type of image data: {}".format(b.dtype))
 print("Shape of the stack: {}".format(b.shape))
 
@@ -77,4 +84,34 @@ b=Im[:250:25]
 print("data type of image data: {}".format(b.dtype))
 print("Shape of the stack: {}".format(b.shape))
 
+print("\nReading the first 250 frames with registration, pipelined (2 registration workers):")
+b=Im.read_pipelined(slice(0,250), chunksize=50, nregistrars=2)
+print("data type of image data: {}".format(b.dtype))
+print("Shape of the stack: {}".format(b.shape))
+
+print("\nReading the every 25th frame from the first 250 frames, with registration and on-disk cache (twice):")
+Im.regcachepath = os.path.join(Im.filepath, "regcache")
+b=Im[:250:25]
+c=Im[:250:25]
+print("Identical: {}".format(np.array_equal(b,c)))
+print("Shape of the stack: {}".format(c.shape))
+
+print("\nExtracting suite2p ROI traces from the first 300 frames, with registration:")
+stats = suite2psupport.load_suite2p_stat( Im.filepath )
+F, Fneu = suite2psupport.extract_traces( Im, stats[Im.plane], frames=slice(0,300), ops=Im.imregparams[0][Im.plane] )
+print("Shape of F: {}, shape of Fneu: {}".format(F.shape, Fneu.shape))
+roi = stats[Im.plane][0]
+keep = ~np.asarray(roi.get("overlap", np.zeros(len(roi["lam"]),dtype=bool)), dtype=bool)
+lam = roi["lam"][keep] / roi["lam"][keep].sum()
+d = Im[:300]
+F_direct = (d[roi["ypix"][keep],roi["xpix"][keep],:].astype(np.float64) * lam[:,np.newaxis]).sum(axis=0)
+print("ROI 0 matches direct pixel indexing: {}".format(np.allclose(F[0,:], F_direct, rtol=1e-4, atol=1e-2)))
+
+print("\nComputing registration metrics of the first 300 frames:")
+metrics = suite2psupport.registration_metrics( Im, Im.imregparams[0][Im.plane]["refImg"], frames=slice(0,300) )
+for key in ["corr", "yshift", "xshift", "sharpness", "meanimg"]:
+    print("- {}: shape {}".format(key, metrics[key].shape))
+print("- crispness: {}".format(metrics["crispness"]))
+print("- mean correlation to refImg: {}".format(metrics["corr"].mean()))
+
 print("\nDone testing\n")
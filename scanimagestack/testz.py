@@ -13,8 +13,8 @@ Created on Tue Jun 22, 2021
 """
 
 import sys
-sys.path.append('../suite2psupport')
-import si_stack
+sys.path.insert(0,'..')
+from scanimagestack import si_stack
 import suite2psupport
 
 import argparse
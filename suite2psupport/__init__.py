@@ -1,5 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from .suite2psupport import suite2p_plane_folders
 from .suite2psupport import load_suite2p_ops
+from .suite2psupport import load_suite2p_stat
 from .suite2psupport import shift_imagedata
+from .extraction import roi_weight_matrix
+from .extraction import extract_traces
+from .extraction import extract_traces_allplanes
+from .regmetrics import registration_metrics
+from .regmetrics import registration_metrics_allplanes
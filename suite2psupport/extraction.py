@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+This module holds functions to extract fluorescence traces of suite2p ROIs directly from an image stack, streaming the (registered) frames in chunks so that the full movie never has to be loaded into memory
+
+Requires suite2p (scipy)
+
+Created on Mon Oct 19, 2026
+
+@author: pgoltstein
+"""
+
+#<><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
+# Imports
+import numpy as np
+from scipy import sparse
+from .suite2psupport import plane_view, map_planes
+
+
+#<><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
+# Functions
+
+def neuropil_mask( roi, cell_pixels, Ly, Lx, inner_neuropil_radius=2, min_neuropil_pixels=350 ):
+    """ Returns the flat (y*Lx+x) pixel indices of the neuropil annulus around a ROI. The annulus starts inner_neuropil_radius pixels outside the ROI and is grown until it holds at least min_neuropil_pixels pixels that do not belong to any ROI.
+        Inputs
+        - roi: suite2p stat dictionary of a single ROI
+        - cell_pixels: Boolean [Ly x Lx] array, True for pixels that belong to any ROI
+        - Ly, Lx: Size of the imaging frame
+        - inner_neuropil_radius: Number of pixels between the ROI and the annulus
+        - min_neuropil_pixels: Minimum number of pixels in the annulus
+        Returns
+        - mask: np.ndarray with flat pixel indices
+    """
+
+    # Use the precomputed mask if suite2p stored it in stat
+    if "neuropil_mask" in roi:
+        return np.asarray(roi["neuropil_mask"]).astype(int)
+
+    ypix = np.asarray(roi["ypix"])
+    xpix = np.asarray(roi["xpix"])
+    yc,xc = np.median(ypix), np.median(xpix)
+    radius = np.sqrt( ((ypix-yc)**2 + (xpix-xc)**2).max() ) if len(ypix) > 0 else 0.0
+    inner = radius + inner_neuropil_radius
+
+    # Grow the annulus until it holds enough pixels, or covers the whole frame
+    outer = inner + 5
+    max_outer = np.sqrt(Ly**2 + Lx**2)
+    while True:
+        y0,y1 = max(0, int(yc-outer)), min(Ly, int(yc+outer)+1)
+        x0,x1 = max(0, int(xc-outer)), min(Lx, int(xc+outer)+1)
+        yy,xx = np.mgrid[y0:y1,x0:x1]
+        dist = np.sqrt( (yy-yc)**2 + (xx-xc)**2 )
+        in_annulus = (dist > inner) & (dist <= outer) & ~cell_pixels[y0:y1,x0:x1]
+        if in_annulus.sum() >= min_neuropil_pixels or outer >= max_outer:
+            break
+        outer += 5
+    return (yy[in_annulus] * Lx) + xx[in_annulus]
+
+
+def roi_weight_matrix( stat, Ly, Lx, inner_neuropil_radius=2, min_neuropil_pixels=350, allow_overlap=False ):
+    """ Builds a sparse weight matrix that maps flattened frames onto ROI and neuropil traces. Rows 0..nrois-1 hold the lam weighted ROI masks (normalized to sum to one), rows nrois..2*nrois-1 hold the uniform neuropil masks.
+        Inputs
+        - stat: Array of suite2p ROI dictionaries (stat.npy of a single plane)
+        - Ly, Lx: Size of the imaging frame
+        - inner_neuropil_radius: Number of pixels between ROI and neuropil annulus
+        - min_neuropil_pixels: Minimum number of pixels in the neuropil annulus
+        - allow_overlap: If False, pixels that are shared by multiple ROIs are excluded (as in suite2p)
+        Returns
+        - W: scipy.sparse.csr_matrix [2*nrois x Ly*Lx] of type float32
+    """
+
+    nrois = len(stat)
+
+    # Map of all pixels that belong to a ROI, these are excluded from the neuropil
+    cell_pixels = np.zeros((Ly,Lx), dtype=bool)
+    for roi in stat:
+        cell_pixels[roi["ypix"],roi["xpix"]] = True
+
+    rows, cols, weights = [], [], []
+    for r,roi in enumerate(stat):
+
+        # ROI mask, lam weighted
+        ypix = np.asarray(roi["ypix"])
+        xpix = np.asarray(roi["xpix"])
+        lam = np.asarray(roi["lam"], dtype=np.float64)
+        if not allow_overlap and "overlap" in roi:
+            keep = ~np.asarray(roi["overlap"], dtype=bool)
+            ypix, xpix, lam = ypix[keep], xpix[keep], lam[keep]
+        if lam.sum() > 0:
+            rows.append( np.full(len(lam), r) )
+            cols.append( (ypix * Lx) + xpix )
+            weights.append( lam / lam.sum() )
+
+        # Neuropil mask, uniform weights
+        npix = neuropil_mask( roi, cell_pixels, Ly, Lx, inner_neuropil_radius=inner_neuropil_radius, min_neuropil_pixels=min_neuropil_pixels )
+        if len(npix) > 0:
+            rows.append( np.full(len(npix), nrois+r) )
+            cols.append( npix )
+            weights.append( np.full(len(npix), 1.0/len(npix)) )
+
+    if len(rows) > 0:
+        rows, cols, weights = np.concatenate(rows), np.concatenate(cols), np.concatenate(weights)
+    W = sparse.csr_matrix( (np.asarray(weights, dtype=np.float32), (np.asarray(rows, dtype=int), np.asarray(cols, dtype=int))), shape=(2*nrois, Ly*Lx) )
+    return W
+
+
+def extract_traces( imagestack, stat, plane_no=None, channel=None, frames=slice(None), chunksize=1000, W=None, ops=None, nregistrars=1 ):
+    """ Extracts ROI and neuropil traces from the image stack by streaming chunks of frames through the pipelined reader (XYT.read_pipelined); memory use is bounded by the chunk size. Registration is applied if it is enabled on the image stack (e.g. imregfunc = shift_imagedata).
+        Inputs
+        - imagestack: scanimagestack.XYT object
+        - stat: Array of suite2p ROI dictionaries of the plane
+        - plane_no: Image plane to extract from (default: current plane of imagestack)
+        - channel: Image channel to extract from (default: current channel of imagestack)
+        - frames: NumPy-style frame indices (default: all frames)
+        - chunksize: Number of frames that are read and processed at once
+        - W: Precomputed weight matrix (roi_weight_matrix), will be built if None
+        - ops: suite2p ops dictionary of the plane, used for the neuropil parameters
+        - nregistrars: Number of registration workers in the pipeline
+        Returns
+        - F: np.ndarray [nrois x number of requested frames] ROI fluorescence
+        - Fneu: np.ndarray [nrois x number of requested frames] neuropil fluorescence
+    """
+
+    imagestack = plane_view( imagestack, plane_no=plane_no, channel=channel )
+    Ly, Lx = imagestack.resolution
+
+    # Build the weight matrix once
+    if W is None:
+        ops = {} if ops is None else ops
+        W = roi_weight_matrix( stat, Ly, Lx,
+            inner_neuropil_radius=ops.get("inner_neuropil_radius", 2),
+            min_neuropil_pixels=ops.get("min_neuropil_pixels", 350),
+            allow_overlap=ops.get("allow_overlap", False) )
+    nrois = int(W.shape[0] / 2)
+
+    # Stream chunks and project them on the weight matrix
+    frames = imagestack._readplan(frames).frames
+    traces = np.zeros((2*nrois, len(frames)), dtype=np.float32)
+    def project_chunk(start, imagedata):
+        n = imagedata.shape[2]
+        traces[:,start:start+n] = W @ imagedata.reshape(Ly*Lx, n).astype(np.float32)
+    imagestack.read_pipelined( frames, consumer=project_chunk, chunksize=chunksize, nregistrars=nregistrars )
+
+    return traces[:nrois,:], traces[nrois:,:]
+
+
+def extract_traces_allplanes( imagestack, stats, channel=None, frames=slice(None), chunksize=1000, ops=None, nworkers=None, nregistrars=1 ):
+    """ Extracts ROI and neuropil traces for all planes, processing planes in parallel
+        Inputs
+        - imagestack: scanimagestack.XYT object
+        - stats: List of stat arrays, list index is plane number (load_suite2p_stat)
+        - channel: Image channel to extract from (default: current channel of imagestack)
+        - frames: NumPy-style frame indices (default: all frames)
+        - chunksize: Number of frames that are read and processed at once
+        - ops: Array of suite2p ops dictionaries, list index is plane number (load_suite2p_ops)
+        - nworkers: Number of planes processed in parallel (default: one per plane)
+        - nregistrars: Number of registration workers per plane
+        Returns
+        - F: List of np.ndarrays [nrois x number of requested frames] ROI fluorescence per plane
+        - Fneu: List of np.ndarrays [nrois x number of requested frames] neuropil fluorescence per plane
+    """
+
+    def extract_plane(p):
+        return extract_traces( imagestack, stats[p], plane_no=p, channel=channel, frames=frames, chunksize=chunksize, ops=None if ops is None else ops[p], nregistrars=nregistrars )
+    results = map_planes( extract_plane, len(stats), nworkers=nworkers )
+    F = [ res[0] for res in results ]
+    Fneu = [ res[1] for res in results ]
+    return F, Fneu
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+This module holds functions to assess the quality of motion correction, by streaming chunks of registered frames from an image stack and comparing them to the suite2p reference image
+
+Requires suite2p
+
+Created on Mon Oct 19, 2026
+
+@author: pgoltstein
+"""
+
+#<><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
+# Imports
+import numpy as np
+from .suite2psupport import plane_view, map_planes
+
+
+#<><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
+# Functions
+
+def frame_correlation( imagedata, refimg ):
+    """ Pearson correlation of every frame to the reference image
+        Inputs
+        - imagedata: Image data [y x x x t]
+        - refimg: Reference image [y x x]
+        Returns
+        - corr: np.ndarray [t]
+    """
+    nframes = imagedata.shape[2]
+    frames = imagedata.reshape(-1, nframes).astype(np.float32)
+    frames = frames - frames.mean(axis=0, keepdims=True)
+    ref = refimg.ravel().astype(np.float32)
+    ref = ref - ref.mean()
+    norms = np.sqrt( (frames**2).sum(axis=0) ) * np.sqrt( (ref**2).sum() )
+    norms[norms == 0] = np.inf
+    return (ref @ frames) / norms
+
+
+def residual_shifts( imagedata, refimg, maxshift=None, batchsize=16 ):
+    """ Estimates the remaining rigid displacement of every frame relative to the reference image, using batched FFT phase correlation
+        Inputs
+        - imagedata: Image data [y x x x t]
+        - refimg: Reference image [y x x]
+        - maxshift: Largest shift (in pixels) that is considered, default is half the frame
+        - batchsize: Number of frames per FFT batch, bounds the memory of the correlation maps
+        Returns
+        - yshift: np.ndarray [t] displacement along y
+        - xshift: np.ndarray [t] displacement along x
+    """
+    Ly, Lx, nframes = imagedata.shape
+    fref = np.conj( np.fft.rfft2( refimg.astype(np.float32) ) )[:,:,np.newaxis]
+
+    # Signed shifts that are considered, and their (wrapped) position in the correlation map
+    yhalf, xhalf = Ly//2, Lx//2
+    if maxshift is None:
+        ys = np.arange(-yhalf, Ly-yhalf)
+        xs = np.arange(-xhalf, Lx-xhalf)
+    else:
+        maxshift = int(maxshift)
+        ys = np.arange(-min(maxshift,yhalf), min(maxshift,Ly-1-yhalf)+1)
+        xs = np.arange(-min(maxshift,xhalf), min(maxshift,Lx-1-xhalf)+1)
+    window = np.ix_( np.mod(ys,Ly), np.mod(xs,Lx) )
+
+    yshift = np.zeros(nframes, dtype=int)
+    xshift = np.zeros(nframes, dtype=int)
+    magnitude = None
+    for start in range(0, nframes, batchsize):
+        stop = min(start+batchsize, nframes)
+
+        # Phase correlation over the first two axes, normalized in place
+        crosspower = np.fft.rfft2( imagedata[:,:,start:stop].astype(np.float32), axes=(0,1) )
+        crosspower *= fref
+        if magnitude is None:
+            magnitude = np.empty( crosspower.shape[:2]+(batchsize,), dtype=crosspower.real.dtype )
+        batch_magnitude = magnitude[:,:,:stop-start]
+        np.abs(crosspower, out=batch_magnitude)
+        batch_magnitude += 1e-5
+        crosspower /= batch_magnitude
+        cc = np.fft.irfft2( crosspower, s=(Ly,Lx), axes=(0,1) )
+
+        # Peak within the window of considered shifts
+        cc = cc[window]
+        peak = np.argmax( cc.reshape(-1, stop-start), axis=0 )
+        yix, xix = np.unravel_index( peak, cc.shape[:2] )
+        yshift[start:stop], xshift[start:stop] = ys[yix], xs[xix]
+    return yshift, xshift
+
+
+def frame_sharpness( imagedata ):
+    """ Sharpness of every frame, the mean squared spatial gradient normalized by the squared mean intensity
+        Inputs
+        - imagedata: Image data [y x x x t]
+        Returns
+        - sharpness: np.ndarray [t]
+    """
+    imagedata = imagedata.astype(np.float32)
+    gy = np.diff(imagedata, axis=0)
+    gx = np.diff(imagedata, axis=1)
+    energy = (gy**2).mean(axis=(0,1)) + (gx**2).mean(axis=(0,1))
+    meanint = imagedata.mean(axis=(0,1))**2
+    meanint[meanint == 0] = np.inf
+    return energy / meanint
+
+
+def crispness( meanimg ):
+    """ Crispness of an (average) image, the norm of its spatial gradient
+        Inputs
+        - meanimg: Image [y x x]
+        Returns
+        - crispness: float
+    """
+    gy, gx = np.gradient( meanimg.astype(np.float64) )
+    return float( np.sqrt( (gy**2).sum() + (gx**2).sum() ) )
+
+
+def registration_metrics( imagestack, refimg, plane_no=None, channel=None, frames=slice(None), chunksize=100, maxshift=None, nregistrars=1 ):
+    """ Computes motion correction quality metrics of a single plane by streaming chunks of (registered) frames through the pipelined reader (XYT.read_pipelined). Registration is applied if it is enabled on the image stack (e.g. imregfunc = shift_imagedata).
+        Inputs
+        - imagestack: scanimagestack.XYT object
+        - refimg: Reference image of the plane (ops['refImg'])
+        - plane_no: Image plane (default: current plane of imagestack)
+        - channel: Image channel (default: current channel of imagestack)
+        - frames: NumPy-style frame indices (default: all frames)
+        - chunksize: Number of frames that are read and processed at once
+        - maxshift: Largest residual shift (in pixels) that is considered
+        - nregistrars: Number of registration workers in the pipeline
+        Returns
+        - metrics: Dictionary holding per-frame arrays (one value per requested frame) "corr", "yshift", "xshift" and "sharpness", the average image "meanimg" and its "crispness"
+    """
+
+    imagestack = plane_view( imagestack, plane_no=plane_no, channel=channel )
+    Ly, Lx = imagestack.resolution
+    refimg = np.asarray(refimg)
+
+    frames = imagestack._readplan(frames).frames
+    nframes = len(frames)
+    metrics = { "corr": np.zeros(nframes, dtype=np.float32),
+                "yshift": np.zeros(nframes, dtype=np.int16),
+                "xshift": np.zeros(nframes, dtype=np.int16),
+                "sharpness": np.zeros(nframes, dtype=np.float32) }
+    summed = np.zeros((Ly,Lx), dtype=np.float64)
+
+    def measure_chunk(start, imagedata):
+        stop = start + imagedata.shape[2]
+        metrics["corr"][start:stop] = frame_correlation( imagedata, refimg )
+        metrics["yshift"][start:stop], metrics["xshift"][start:stop] = residual_shifts( imagedata, refimg, maxshift=maxshift )
+        metrics["sharpness"][start:stop] = frame_sharpness( imagedata )
+        summed[:] += imagedata.sum(axis=2)
+    imagestack.read_pipelined( frames, consumer=measure_chunk, chunksize=chunksize, nregistrars=nregistrars )
+
+    metrics["meanimg"] = (summed / max(nframes,1)).astype(np.float32)
+    metrics["crispness"] = crispness( metrics["meanimg"] )
+    return metrics
+
+
+def registration_metrics_allplanes( imagestack, suite2p_ops, channel=None, frames=slice(None), chunksize=100, maxshift=None, nworkers=None, nregistrars=1 ):
+    """ Computes motion correction quality metrics for all planes, processing planes in parallel
+        Inputs
+        - imagestack: scanimagestack.XYT object
+        - suite2p_ops: Array of suite2p ops dictionaries, list index is plane number (load_suite2p_ops)
+        - channel: Image channel (default: current channel of imagestack)
+        - frames: NumPy-style frame indices (default: all frames)
+        - chunksize: Number of frames that are read and processed at once
+        - maxshift: Largest residual shift (in pixels) that is considered, default is ops['maxregshift'] * frame size
+        - nworkers: Number of planes processed in parallel (default: one per plane)
+        - nregistrars: Number of registration workers per plane
+        Returns
+        - metrics: List of metrics dictionaries, one per plane (see registration_metrics)
+    """
+
+    def measure_plane(p):
+        plane_maxshift = maxshift
+        if plane_maxshift is None and "maxregshift" in suite2p_ops[p]:
+            plane_maxshift = int( np.round( suite2p_ops[p]["maxregshift"] * max(imagestack.resolution) ) )
+        return registration_metrics( imagestack, suite2p_ops[p]["refImg"], plane_no=p, channel=channel, frames=frames, chunksize=chunksize, maxshift=plane_maxshift, nregistrars=nregistrars )
+    return map_planes( measure_plane, len(suite2p_ops), nworkers=nworkers )
@@ -14,22 +14,35 @@ Created on Thu May 7, 2020
 #<><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
 # Imports
 import os.path, glob
+import re
+import copy
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from suite2p.registration import rigid, nonrigid, bidiphase
 
 
 #<><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
 # Functions
 
+def suite2p_plane_folders( filepath ):
+    """ Returns the suite2p plane folders, sorted by plane number (plane0, plane1, ..., plane10), so that list index equals plane number
+    """
+    plane_query = os.path.join( filepath, "suite2p", "plane*" )
+    plane_folders = []
+    for plane_folder in glob.glob(plane_query):
+        match = re.fullmatch( r"plane(\d+)", os.path.basename(plane_folder) )
+        if match and os.path.isdir(plane_folder):
+            plane_folders.append( (int(match.group(1)), plane_folder) )
+    return [ plane_folder for _,plane_folder in sorted(plane_folders) ]
+
+
 def load_suite2p_ops( filepath ):
-    """ Load the multiplane ops file
+    """ Load the multiplane ops file, ordered by plane number
     """
 
     # Find planes
     ops = []
-    plane_query = os.path.join( filepath, "suite2p", "plane*" )
-    plane_folders = glob.glob(plane_query)
-    for plane_folder in plane_folders:
+    for plane_folder in suite2p_plane_folders(filepath):
         opsfile = os.path.join( plane_folder, "ops.npy" )
         ops_plane = np.load( opsfile, allow_pickle=True)
 
@@ -44,6 +57,49 @@ def load_suite2p_ops( filepath ):
     return ops
 
 
+def load_suite2p_stat( filepath ):
+    """ Load the multiplane stat files, ordered by plane number (as load_suite2p_ops)
+        Inputs
+        - filepath: Path to the folder that holds the suite2p folder
+        Returns
+        - stats: List (one entry per plane) holding an array of ROI dictionaries
+    """
+    stats = []
+    for plane_folder in suite2p_plane_folders(filepath):
+        statfile = os.path.join( plane_folder, "stat.npy" )
+        stats.append( np.load( statfile, allow_pickle=True) )
+    return stats
+
+
+def plane_view( imagestack, plane_no=None, channel=None ):
+    """ Returns a (shallow) copy of the image stack set to plane and channel, so that plane and channel of the supplied stack stay untouched
+        Inputs
+        - imagestack: scanimagestack.XYT object
+        - plane_no: Image plane (default: current plane of imagestack)
+        - channel: Image channel (default: current channel of imagestack)
+    """
+    imagestack = copy.copy(imagestack)
+    if plane_no is not None:
+        imagestack.plane = plane_no
+    if channel is not None:
+        imagestack.channel = channel
+    return imagestack
+
+
+def map_planes( plane_func, nplanes, nworkers=None ):
+    """ Calls plane_func(plane_no) for all planes, processing planes in parallel threads
+        Inputs
+        - plane_func: Function that takes the plane number as only input
+        - nplanes: Number of planes
+        - nworkers: Number of planes processed in parallel (default: one per plane)
+        Returns
+        - results: List with the outputs of plane_func, list index is plane number
+    """
+    nworkers = nplanes if nworkers is None else nworkers
+    with ThreadPoolExecutor(max_workers=max(1,nworkers)) as executor:
+        return list( executor.map( plane_func, range(nplanes) ) )
+
+
 def shift_imagedata( imagedata, plane_no, frames, suite2p_ops ):
     """ Realignes image data to parameters in the ops dictionary
     """